@@ -1,10 +1,212 @@
 """
 Shared helper functions for AI Agents
 """
+import atexit
+import contextlib
+import functools
+import json
 import os
+import re
 import sqlite3
-from typing import Dict, Any
-from datetime import datetime, timedelta
+import threading
+from typing import Callable, Dict, Any, Tuple
+from datetime import date
+
+try:
+    import orjson
+except ImportError:  # optional; the *_json helpers fall back to stdlib json
+    orjson = None
+
+# =============================================================================
+# CONNECTION MANAGEMENT
+# =============================================================================
+
+# get_conn, transaction and cached_table are the connection layer shared with
+# inventory_tools; everything prefixed with "_" stays internal to this module.
+
+# sqlite3 connections may not be shared across threads, so each thread keeps
+# its own {db_name: connection} map instead of reconnecting on every call.
+# The map survives importlib.reload(db_helper) (the notebooks reload before
+# resetting), so a reset still finds and closes the open connections; with
+# DB_INMEMORY=1 that close is what actually drops the old data.
+_local = globals().get('_local') or threading.local()
+
+# Applied once per connection: WAL so readers never block the refund/PO writer,
+# NORMAL sync to skip redundant fsyncs, and a ~20MB page cache that keeps
+# these small tables fully resident.
+_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA foreign_keys=ON',
+)
+
+
+# Columns declared DAYNUM (sales_history.date) hold the day as an INTEGER
+# ordinal (date.toordinal()), so compares are on integers instead of strings;
+# bind date.toordinal() when filtering on them. The private type name keeps
+# this converter from replacing sqlite3's process-wide "date" converter.
+sqlite3.register_converter('DAYNUM', lambda value: date.fromordinal(int(value)))
+
+
+def _in_memory() -> bool:
+    """True when DB_INMEMORY=1 asks for memory databases instead of .db files"""
+    return os.environ.get('DB_INMEMORY') == '1'
+
+
+def get_conn(db_name: str) -> sqlite3.Connection:
+    """Return this thread's cached connection to db_name, opening it on first use"""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_name)
+    if conn is None:
+        # DB_INMEMORY=1 keeps each database in memory instead of a file. The
+        # memdb VFS shares one "/db_name" database between every connection
+        # in the process and, unlike cache=shared, honours busy_timeout, so
+        # per-thread connections wait for a writer instead of failing with
+        # SQLITE_LOCKED. The database is dropped when the last connection to
+        # it closes (all threads' connections, via _close_conn()).
+        if _in_memory():
+            target, uri = f'file:/{db_name}?vfs=memdb', True
+        else:
+            target, uri = db_name, False
+        # isolation_level=None: no implicit BEGINs, writers use transaction()
+        conn = conns[db_name] = sqlite3.connect(
+            target, uri=uri, isolation_level=None, cached_statements=128,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+    return conn
+
+
+def _close_conn(db_name: str) -> None:
+    """Close and evict this thread's cached connection to db_name, if any"""
+    conn = getattr(_local, 'conns', {}).pop(db_name, None)
+    if conn is not None:
+        # Refresh planner statistics for the queries this connection ran
+        conn.execute('PRAGMA optimize')
+        conn.close()
+
+
+@contextlib.contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Run the enclosed statements as one BEGIN IMMEDIATE ... COMMIT block"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        # Inside the try: deferred foreign-key violations surface here
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+@atexit.register
+def _close_all_conns() -> None:
+    """Close the calling thread's cached connections at interpreter exit"""
+    for db_name in list(getattr(_local, 'conns', {})):
+        _close_conn(db_name)
+
+
+# Seeded reference tables (customers, products) are not modified by any tool,
+# so each one is read once per database and then served from memory.
+# Kept across reloads for the same reason as _local.
+_cache_lock = globals().get('_cache_lock') or threading.Lock()
+_table_cache: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = globals().get('_table_cache', {})
+
+
+def cached_table(db_name: str, sql: str) -> Dict[str, Dict[str, Any]]:
+    """Return {first column: row dict} for sql, querying the database only on first use"""
+    key = (db_name, sql)
+    with _cache_lock:
+        rows = _table_cache.get(key)
+        if rows is None:
+            cursor = get_conn(db_name).execute(sql)
+            columns = [col[0] for col in cursor.description]
+            rows = _table_cache[key] = {row[0]: dict(zip(columns, row)) for row in cursor}
+    return rows
+
+
+def _invalidate_cache(db_name: str) -> None:
+    """Drop every cached row read from db_name"""
+    with _cache_lock:
+        for key in [key for key in _table_cache if key[0] == db_name]:
+            del _table_cache[key]
+    _search_customers.cache_clear()
+
+
+# =============================================================================
+# SQL STATEMENTS
+# =============================================================================
+
+# Hot lookups share one module-level string each so every call hits the
+# connection's prepared-statement cache instead of re-parsing the SQL.
+_SQL_ALL_CUSTOMERS = 'SELECT customer_id, name, email, tier, balance FROM customers'
+
+# Name search goes through the customers_fts full-text index rather than
+# scanning customers with LOWER(name) LIKE ...
+_SQL_LOOKUP_CUSTOMER_BY_NAME = '''
+SELECT c.customer_id, c.name, c.email, c.tier, c.balance
+FROM customers_fts f
+JOIN customers c ON c.customer_id = f.customer_id
+WHERE customers_fts MATCH ?
+'''
+
+_SQL_ORDER_STATUS = '''
+SELECT o.order_id, o.customer_id, o.status, o.items, o.total,
+       o.tracking, o.estimated_delivery, c.name AS customer_name
+FROM orders o
+JOIN customers c ON o.customer_id = c.customer_id
+WHERE o.order_id = ?
+'''
+
+# One row per order, or a single row with NULL order columns when the
+# customer exists but has no orders; no rows means no such customer.
+_SQL_CUSTOMER_ORDERS = '''
+SELECT c.name AS customer_name, o.order_id, o.status, o.items, o.total, o.estimated_delivery
+FROM customers c
+LEFT JOIN orders o ON o.customer_id = c.customer_id
+WHERE c.customer_id = ?
+ORDER BY o.created_at DESC
+'''
+_ORDER_FIELDS = ("order_id", "status", "items", "total", "estimated_delivery")
+
+# Everything process_refund validates, in one round-trip: refund_id is NULL
+# unless the order has already been refunded.
+_SQL_REFUND_CHECK = '''
+SELECT o.order_id, o.status, o.total, r.refund_id
+FROM orders o
+LEFT JOIN refunds r ON r.order_id = o.order_id
+WHERE o.order_id = ?
+'''
+
+
+# =============================================================================
+# JSON ENCODING
+# =============================================================================
+
+def _to_json(result: Any) -> bytes:
+    """Encode a tool result as compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(result)
+    # Same bytes as orjson: no padding after separators, no \u escapes
+    return json.dumps(result, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def json_variant(func: Callable[..., Any]) -> Callable[..., bytes]:
+    """Wrap a tool helper so it returns its result already JSON-encoded"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> bytes:
+        return _to_json(func(*args, **kwargs))
+    wrapper.__name__ = wrapper.__qualname__ = f"{func.__name__}_json"
+    return wrapper
+
 
 # =============================================================================
 # DATABASE HELPER FUNCTIONS
@@ -12,93 +214,111 @@ from datetime import datetime, timedelta
 
 def init_database(db_name='customer_support.db'):
     """Create and populate the database"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    # Create customers table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS customers (
-        customer_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        email TEXT NOT NULL,
-        tier TEXT NOT NULL,
-        balance REAL DEFAULT 0.0,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create orders table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS orders (
-        order_id TEXT PRIMARY KEY,
-        customer_id TEXT NOT NULL,
-        status TEXT NOT NULL,
-        items TEXT NOT NULL,
-        total REAL NOT NULL,
-        tracking TEXT,
-        estimated_delivery TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
-    )
-    ''')
-    
-    # Create refunds table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS refunds (
-        refund_id TEXT PRIMARY KEY,
-        order_id TEXT NOT NULL,
-        amount REAL NOT NULL,
-        reason TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (order_id) REFERENCES orders (order_id)
-    )
-    ''')
+    conn = get_conn(db_name)
     
-    # Insert sample customers
-    customers = [
-        ('CUST001', 'Sarah Johnson', 'sarah.j@email.com', 'premium', 150.00),
-        ('CUST002', 'Mike Chen', 'mike.c@email.com', 'standard', 0.00),
-        ('CUST003', 'Emma Williams', 'emma.w@email.com', 'premium', -25.00),
-        ('CUST004', 'David Brown', 'david.b@email.com', 'standard', 75.00),
-    ]
-    
-    cursor.executemany('''
-    INSERT OR IGNORE INTO customers (customer_id, name, email, tier, balance)
-    VALUES (?, ?, ?, ?, ?)
-    ''', customers)
-    
-    # Insert sample orders
-    orders = [
-        ('ORD12345', 'CUST001', 'shipped', 'Laptop, Mouse', 1299.99, 'TRK789456123', '2025-01-25'),
-        ('ORD12346', 'CUST002', 'processing', 'Headphones', 199.99, None, '2025-01-28'),
-        ('ORD12347', 'CUST003', 'delivered', 'Keyboard, Webcam', 249.99, 'TRK789456124', '2025-01-20'),
-        ('ORD12348', 'CUST001', 'delivered', 'Monitor', 399.99, 'TRK789456125', '2025-01-15'),
-        ('ORD12349', 'CUST004', 'cancelled', 'Mouse Pad', 15.99, None, None),
-    ]
-    
-    cursor.executemany('''
-    INSERT OR IGNORE INTO orders (order_id, customer_id, status, items, total, tracking, estimated_delivery)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', orders)
+    # Create the schema and seed it in a single transaction
+    with transaction(conn):
+        # Check foreign keys once at COMMIT rather than per inserted row
+        conn.execute('PRAGMA defer_foreign_keys=ON')
+        
+        # Create customers table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            customer_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            tier TEXT NOT NULL,
+            balance REAL DEFAULT 0.0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # Create orders table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            items TEXT NOT NULL,
+            total REAL NOT NULL,
+            tracking TEXT,
+            estimated_delivery TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
+        )
+        ''')
+        
+        # Create refunds table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS refunds (
+            refund_id TEXT PRIMARY KEY,
+            order_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (order_id)
+        )
+        ''')
+        
+        # Index the per-customer order listing and the per-order refund check
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_cust_created ON orders(customer_id, created_at DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_refunds_order ON refunds(order_id)')
+        
+        # Full-text index over customer names for lookup_customer_by_name
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts
+        USING fts5(name, customer_id UNINDEXED, tokenize='unicode61')
+        ''')
+        
+        # Insert sample customers
+        customers = [
+            ('CUST001', 'Sarah Johnson', 'sarah.j@email.com', 'premium', 150.00),
+            ('CUST002', 'Mike Chen', 'mike.c@email.com', 'standard', 0.00),
+            ('CUST003', 'Emma Williams', 'emma.w@email.com', 'premium', -25.00),
+            ('CUST004', 'David Brown', 'david.b@email.com', 'standard', 75.00),
+        ]
+        
+        conn.executemany('''
+        INSERT OR IGNORE INTO customers (customer_id, name, email, tier, balance)
+        VALUES (?, ?, ?, ?, ?)
+        ''', customers)
+        
+        # Insert sample orders
+        orders = [
+            ('ORD12345', 'CUST001', 'shipped', 'Laptop, Mouse', 1299.99, 'TRK789456123', '2025-01-25'),
+            ('ORD12346', 'CUST002', 'processing', 'Headphones', 199.99, None, '2025-01-28'),
+            ('ORD12347', 'CUST003', 'delivered', 'Keyboard, Webcam', 249.99, 'TRK789456124', '2025-01-20'),
+            ('ORD12348', 'CUST001', 'delivered', 'Monitor', 399.99, 'TRK789456125', '2025-01-15'),
+            ('ORD12349', 'CUST004', 'cancelled', 'Mouse Pad', 15.99, None, None),
+        ]
+        
+        conn.executemany('''
+        INSERT OR IGNORE INTO orders (order_id, customer_id, status, items, total, tracking, estimated_delivery)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', orders)
+        
+        conn.execute('''
+        INSERT INTO customers_fts (name, customer_id)
+        SELECT name, customer_id FROM customers
+        WHERE customer_id NOT IN (SELECT customer_id FROM customers_fts)
+        ''')
 
-    conn.commit()
-    conn.close()
+        conn.execute('ANALYZE')
+    _invalidate_cache(db_name)
 
 
 # Interactive Database Explorer
 def explore_database():
     """Interactive tool to explore the database"""
-    conn = sqlite3.connect('customer_support.db')
+    conn = get_conn('customer_support.db')
     
     print("=" * 60)
     print("DATABASE EXPLORER")
     print("=" * 60)
     
     # Show table schemas
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = cursor.fetchall()
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'customers_fts%'")
     
     print("\n📋 Available Tables:")
     for table in tables:
@@ -106,23 +326,20 @@ def explore_database():
         print(f"\n  {table_name.upper()}:")
         
         # Get column info
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = cursor.fetchall()
-        for col in columns:
+        for col in conn.execute(f"PRAGMA table_info({table_name})"):
             print(f"    - {col[1]} ({col[2]})")
         
-        # Get row count
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        count = cursor.fetchone()[0]
+        # Get row count: these tables are append-only (rows are never
+        # deleted), so MAX(rowid) is exact and avoids COUNT(*)'s full scan
+        count = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
         print(f"    Total records: {count}")
-    
-    conn.close()
 
 
 # Clean up Dastabase
 def reset_database():
     """Reset the database to original state"""
-    if os.path.exists('customer_support.db'):
+    _close_conn('customer_support.db')
+    if not _in_memory() and os.path.exists('customer_support.db'):
         os.remove('customer_support.db')
     init_database()
     print("🔄 Database reset complete!")
@@ -130,45 +347,32 @@ def reset_database():
 
 def lookup_customer(customer_id: str) -> Dict[str, Any]:
     """Look up customer information by ID"""
-    conn = sqlite3.connect('customer_support.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    SELECT customer_id, name, email, tier, balance
-    FROM customers
-    WHERE customer_id = ?
-    ''', (customer_id,))
-
-    row = cursor.fetchone()
-    conn.close()
+    customer = cached_table('customer_support.db', _SQL_ALL_CUSTOMERS).get(customer_id)
 
-    if row:
+    if customer:
         return {
             "status": "found",
-            "customer": {
-                "customer_id": row[0],
-                "name": row[1],
-                "email": row[2],
-                "tier": row[3],
-                "balance": row[4]
-            }
+            "customer": dict(customer)
         }
     return {"status": "not_found", "message": "Customer not found"}
 
 
-def lookup_customer_by_name(name: str) -> Dict[str, Any]:
-    """Look up customer information by name (case-insensitive partial match)"""
-    conn = sqlite3.connect('customer_support.db')
-    cursor = conn.cursor()
+@functools.lru_cache(maxsize=128)
+def _search_customers(needle: str) -> Tuple[Tuple[Any, ...], ...]:
+    """Run the name search for an already-lowercased needle; results are memoized"""
+    conn = get_conn('customer_support.db')
+    # Every word of the needle must prefix-match a word of the name; a needle
+    # with no words matches everyone, like the old LIKE '%%' did
+    words = re.findall(r'\w+', needle)
+    if not words:
+        return tuple(conn.execute(_SQL_ALL_CUSTOMERS).fetchall())
+    query = ' '.join(f'"{word}"*' for word in words)
+    return tuple(conn.execute(_SQL_LOOKUP_CUSTOMER_BY_NAME, (query,)).fetchall())
 
-    cursor.execute('''
-    SELECT customer_id, name, email, tier, balance
-    FROM customers
-    WHERE LOWER(name) LIKE LOWER(?)
-    ''', (f'%{name}%',))
 
-    rows = cursor.fetchall()
-    conn.close()
+def lookup_customer_by_name(name: str) -> Dict[str, Any]:
+    """Look up customer information by name (case-insensitive word-prefix match)"""
+    rows = _search_customers(name.lower())
 
     if rows:
         customers = []
@@ -190,32 +394,22 @@ def lookup_customer_by_name(name: str) -> Dict[str, Any]:
 
 def check_order_status(order_id: str) -> Dict[str, Any]:
     """Check the status of an order"""
-    conn = sqlite3.connect('customer_support.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT o.order_id, o.customer_id, o.status, o.items, o.total, 
-           o.tracking, o.estimated_delivery, c.name
-    FROM orders o
-    JOIN customers c ON o.customer_id = c.customer_id
-    WHERE o.order_id = ?
-    ''', (order_id,))
+    conn = get_conn('customer_support.db')
     
-    row = cursor.fetchone()
-    conn.close()
+    row = conn.execute(_SQL_ORDER_STATUS, (order_id,)).fetchone()
     
     if row:
         return {
             "status": "found",
             "order": {
-                "order_id": row[0],
-                "customer_id": row[1],
-                "customer_name": row[7],
-                "status": row[2],
-                "items": row[3],
-                "total": row[4],
-                "tracking": row[5],
-                "estimated_delivery": row[6]
+                "order_id": row["order_id"],
+                "customer_id": row["customer_id"],
+                "customer_name": row["customer_name"],
+                "status": row["status"],
+                "items": row["items"],
+                "total": row["total"],
+                "tracking": row["tracking"],
+                "estimated_delivery": row["estimated_delivery"]
             }
         }
     return {"status": "not_found", "message": "Order not found"}
@@ -223,40 +417,23 @@ def check_order_status(order_id: str) -> Dict[str, Any]:
     
 def get_customer_orders(customer_id: str) -> Dict[str, Any]:
     """Get all orders for a customer"""
-    conn = sqlite3.connect('customer_support.db')
-    cursor = conn.cursor()
+    conn = get_conn('customer_support.db')
     
-    # First verify customer exists
-    cursor.execute('SELECT name FROM customers WHERE customer_id = ?', (customer_id,))
-    customer = cursor.fetchone()
+    # Customer and all of their orders in one query
+    rows = conn.execute(_SQL_CUSTOMER_ORDERS, (customer_id,)).fetchall()
     
-    if not customer:
-        conn.close()
+    if not rows:
         return {"status": "error", "message": "Customer not found"}
     
-    # Get all orders
-    cursor.execute('''
-    SELECT order_id, status, items, total, estimated_delivery
-    FROM orders
-    WHERE customer_id = ?
-    ORDER BY created_at DESC
-    ''', (customer_id,))
-    
-    orders = []
-    for row in cursor.fetchall():
-        orders.append({
-            "order_id": row[0],
-            "status": row[1],
-            "items": row[2],
-            "total": row[3],
-            "estimated_delivery": row[4]
-        })
-    
-    conn.close()
+    orders = [
+        {key: row[key] for key in _ORDER_FIELDS}
+        for row in rows
+        if row["order_id"] is not None
+    ]
     
     return {
         "status": "success",
-        "customer_name": customer[0],
+        "customer_name": rows[0]["customer_name"],
         "total_orders": len(orders),
         "orders": orders
     }
@@ -264,56 +441,45 @@ def get_customer_orders(customer_id: str) -> Dict[str, Any]:
 
 def process_refund(order_id: str, reason: str) -> Dict[str, Any]:
     """Process a refund for an order"""
-    conn = sqlite3.connect('customer_support.db')
-    cursor = conn.cursor()
-    
-    # Check if order exists and can be refunded
-    cursor.execute('''
-    SELECT order_id, status, total, customer_id
-    FROM orders
-    WHERE order_id = ?
-    ''', (order_id,))
-    
-    order = cursor.fetchone()
-    
-    if not order:
-        conn.close()
-        return {"status": "error", "message": "Order not found"}
-    
-    order_id, status, total, customer_id = order
-    
-    if status != "delivered":
-        conn.close()
-        return {
-            "status": "error",
-            "message": f"Cannot refund order with status: {status}. Order must be delivered."
-        }
-    
-    # Check if already refunded
-    cursor.execute('SELECT refund_id FROM refunds WHERE order_id = ?', (order_id,))
-    if cursor.fetchone():
-        conn.close()
-        return {
-            "status": "error",
-            "message": "This order has already been refunded"
-        }
-    
-    # Create refund
-    refund_id = f"REF{order_id[3:]}"
-    cursor.execute('''
-    INSERT INTO refunds (refund_id, order_id, amount, reason, status)
-    VALUES (?, ?, ?, ?, 'approved')
-    ''', (refund_id, order_id, total, reason))
-    
-    # Update order status
-    cursor.execute('''
-    UPDATE orders 
-    SET status = 'refunded'
-    WHERE order_id = ?
-    ''', (order_id,))
+    conn = get_conn('customer_support.db')
     
-    conn.commit()
-    conn.close()
+    # The check and the write share one BEGIN IMMEDIATE transaction, so two
+    # concurrent refunds of the same order cannot both pass the check
+    with transaction(conn):
+        # Check if order exists, can be refunded, and has no refund yet
+        order = conn.execute(_SQL_REFUND_CHECK, (order_id,)).fetchone()
+        
+        if not order:
+            return {"status": "error", "message": "Order not found"}
+        
+        order_id, status, total, existing_refund_id = order
+        
+        if status != "delivered":
+            return {
+                "status": "error",
+                "message": f"Cannot refund order with status: {status}. Order must be delivered."
+            }
+        
+        # Check if already refunded
+        if existing_refund_id is not None:
+            return {
+                "status": "error",
+                "message": "This order has already been refunded"
+            }
+        
+        # Create refund
+        refund_id = f"REF{order_id[3:]}"
+        conn.execute('''
+        INSERT INTO refunds (refund_id, order_id, amount, reason, status)
+        VALUES (?, ?, ?, ?, 'approved')
+        ''', (refund_id, order_id, total, reason))
+        
+        # Update order status
+        conn.execute('''
+        UPDATE orders 
+        SET status = 'refunded'
+        WHERE order_id = ?
+        ''', (order_id,))
     
     return {
         "status": "success",
@@ -324,12 +490,21 @@ def process_refund(order_id: str, reason: str) -> Dict[str, Any]:
     }
 
 
+# JSON-encoded variants of the customer support tools, ready to send to the LLM
+lookup_customer_json = json_variant(lookup_customer)
+lookup_customer_by_name_json = json_variant(lookup_customer_by_name)
+check_order_status_json = json_variant(check_order_status)
+get_customer_orders_json = json_variant(get_customer_orders)
+process_refund_json = json_variant(process_refund)
+
+
 # =============================================================================
 # Inventory Database Functions
 # =============================================================================
 def reset_inventory_database(db_name='inventory.db'):
     """Reset inventory database to original state"""
-    if os.path.exists(db_name):
+    _close_conn(db_name)
+    if not _in_memory() and os.path.exists(db_name):
         os.remove(db_name)
         print(f"🗑️  Deleted existing database: {db_name}")
     return init_inventory_database(db_name)
@@ -337,93 +512,100 @@ def reset_inventory_database(db_name='inventory.db'):
     
 def init_inventory_database(db_name='inventory.db'):
     """Create and populate inventory database"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    # Create products table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        product_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        category TEXT NOT NULL,
-        price REAL NOT NULL,
-        stock INTEGER NOT NULL,
-        reorder_point INTEGER NOT NULL,
-        supplier TEXT NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    conn = get_conn(db_name)
     
-    # Create sales history table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS sales_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id TEXT NOT NULL,
-        date TEXT NOT NULL,
-        quantity_sold INTEGER NOT NULL,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    ''')
-    
-    # Create purchase orders table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS purchase_orders (
-        po_id TEXT PRIMARY KEY,
-        product_id TEXT NOT NULL,
-        quantity INTEGER NOT NULL,
-        unit_cost REAL,
-        total_cost REAL,
-        reason TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    ''')
-    
-    # Insert sample products
-    products = [
-        ('PROD001', 'Wireless Mouse', 'Electronics', 29.99, 45, 20, 'TechCorp'),
-        ('PROD002', 'USB-C Cable', 'Electronics', 12.99, 8, 15, 'TechCorp'),
-        ('PROD003', 'Notebook Pack', 'Office Supplies', 8.99, 150, 50, 'OfficeMax'),
-        ('PROD004', 'Desk Lamp', 'Furniture', 45.00, 12, 10, 'HomeGoods'),
-        ('PROD005', 'Ergonomic Chair', 'Furniture', 299.99, 3, 5, 'HomeGoods'),
-    ]
-    
-    cursor.executemany('''
-    INSERT OR IGNORE INTO products (product_id, name, category, price, stock, reorder_point, supplier)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', products)
-    
-    # Insert sample sales history for last 7 days
-    # PROD002 (USB-C Cable) has high demand - will need reordering
-    # PROD005 (Chair) has low stock + low demand
-    sales_data = []
-    
-    for day in range(7):
-        date = (datetime.now() - timedelta(days=6-day)).strftime('%Y-%m-%d')
+    # Create the schema and seed it in a single transaction
+    with transaction(conn):
+        # Check foreign keys once at COMMIT rather than per inserted row
+        conn.execute('PRAGMA defer_foreign_keys=ON')
         
-        # PROD001: Moderate, steady sales
-        sales_data.append(('PROD001', date, 5 + (day % 3)))
+        # Create products table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            product_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            stock INTEGER NOT NULL,
+            reorder_point INTEGER NOT NULL,
+            supplier TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
         
-        # PROD002: HIGH sales - this will trigger reorder!
-        sales_data.append(('PROD002', date, 10 + day * 2))
+        # Create sales history table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id TEXT NOT NULL,
+            date DAYNUM NOT NULL,
+            quantity_sold INTEGER NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products (product_id)
+        )
+        ''')
         
-        # PROD003: Low sales, plenty of stock
-        sales_data.append(('PROD003', date, 2 + (day % 3)))
+        # Create purchase orders table
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_orders (
+            po_id TEXT PRIMARY KEY,
+            product_id TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_cost REAL,
+            total_cost REAL,
+            reason TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (product_id)
+        )
+        ''')
         
-        # PROD004: Very low, sporadic sales
-        sales_data.append(('PROD004', date, day % 2))
+        # Index the per-product sales history and category searches
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_prod_date ON sales_history(product_id, date)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)')
         
-        # PROD005: Low sales, but also low stock
-        sales_data.append(('PROD005', date, 0 if day % 3 == 0 else 1))
-    
-    cursor.executemany('''
-    INSERT OR IGNORE INTO sales_history (product_id, date, quantity_sold)
-    VALUES (?, ?, ?)
-    ''', sales_data)
-    
-    conn.commit()
-    conn.close()
+        # Insert sample products
+        products = [
+            ('PROD001', 'Wireless Mouse', 'Electronics', 29.99, 45, 20, 'TechCorp'),
+            ('PROD002', 'USB-C Cable', 'Electronics', 12.99, 8, 15, 'TechCorp'),
+            ('PROD003', 'Notebook Pack', 'Office Supplies', 8.99, 150, 50, 'OfficeMax'),
+            ('PROD004', 'Desk Lamp', 'Furniture', 45.00, 12, 10, 'HomeGoods'),
+            ('PROD005', 'Ergonomic Chair', 'Furniture', 299.99, 3, 5, 'HomeGoods'),
+        ]
+        
+        conn.executemany('''
+        INSERT OR IGNORE INTO products (product_id, name, category, price, stock, reorder_point, supplier)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', products)
+        
+        # Insert sample sales history for last 7 days
+        # PROD002 (USB-C Cable) has high demand - will need reordering
+        # PROD005 (Chair) has low stock + low demand
+        today = date.today().toordinal()
+        history_days = 7
+        
+        # Quantity sold per product on day 0 (oldest) .. history_days - 1 (today)
+        sales_patterns = {
+            'PROD001': lambda day: 5 + (day % 3),             # Moderate, steady sales
+            'PROD002': lambda day: 10 + day * 2,              # HIGH sales - this will trigger reorder!
+            'PROD003': lambda day: 2 + (day % 3),             # Low sales, plenty of stock
+            'PROD004': lambda day: day % 2,                   # Very low, sporadic sales
+            'PROD005': lambda day: 0 if day % 3 == 0 else 1,  # Low sales, but also low stock
+        }
+        
+        # Streamed straight into executemany; no intermediate row list
+        sales_data = (
+            (product_id, today - (history_days - 1 - day), pattern(day))
+            for day in range(history_days)
+            for product_id, pattern in sales_patterns.items()
+        )
+        
+        conn.executemany('''
+        INSERT OR IGNORE INTO sales_history (product_id, date, quantity_sold)
+        VALUES (?, ?, ?)
+        ''', sales_data)
+        
+        conn.execute('ANALYZE')
+    _invalidate_cache(db_name)
     
     print("✅ Inventory database initialized!")
     print("📊 Sample data:")
@@ -1,92 +1,95 @@
-# Tool definitions for OpenAI-compatible API (z.ai)
-tools = [
+import copy
+import json
+
+# Tool specs, defined once and converted to each provider's schema below
+_TOOLS = [
     {
-        "type": "function",
-        "function": {
-            "name": "lookup_customer",
-            "description": "Look up customer information by customer ID",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "customer_id": {
-                        "type": "string",
-                        "description": "The customer ID (e.g., CUST001)"
-                    }
-                },
-                "required": ["customer_id"]
-            }
+        "name": "lookup_customer",
+        "description": "Look up customer information by customer ID",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "customer_id": {
+                    "type": "string",
+                    "description": "The customer ID (e.g., CUST001)"
+                }
+            },
+            "required": ["customer_id"]
         }
     },
     {
-        "type": "function",
-        "function": {
-            "name": "lookup_customer_by_name",
-            "description": "Look up customer information by name. Use this when you only have a customer's name and need to find their customer ID.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "name": {
-                        "type": "string",
-                        "description": "The customer's name (or partial name) to search for"
-                    }
-                },
-                "required": ["name"]
-            }
+        "name": "lookup_customer_by_name",
+        "description": "Look up customer information by name. Use this when you only have a customer's name and need to find their customer ID.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "The customer's name to search for. Words may be given partially, from their start (e.g., 'sar john' matches Sarah Johnson)"
+                }
+            },
+            "required": ["name"]
         }
     },
     {
-        "type": "function",
-        "function": {
-            "name": "check_order_status",
-            "description": "Check the status and details of a specific order",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "The order ID (e.g., ORD12345)"
-                    }
-                },
-                "required": ["order_id"]
-            }
+        "name": "check_order_status",
+        "description": "Check the status and details of a specific order",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {
+                    "type": "string",
+                    "description": "The order ID (e.g., ORD12345)"
+                }
+            },
+            "required": ["order_id"]
         }
     },
     {
-        "type": "function",
-        "function": {
-            "name": "get_customer_orders",
-            "description": "Get all orders for a specific customer",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "customer_id": {
-                        "type": "string",
-                        "description": "The customer ID"
-                    }
-                },
-                "required": ["customer_id"]
-            }
+        "name": "get_customer_orders",
+        "description": "Get all orders for a specific customer",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "customer_id": {
+                    "type": "string",
+                    "description": "The customer ID"
+                }
+            },
+            "required": ["customer_id"]
         }
     },
     {
-        "type": "function",
-        "function": {
-            "name": "process_refund",
-            "description": "Process a refund for a delivered order",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {
-                        "type": "string",
-                        "description": "The order ID to refund"
-                    },
-                    "reason": {
-                        "type": "string",
-                        "description": "Reason for the refund"
-                    }
+        "name": "process_refund",
+        "description": "Process a refund for a delivered order",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {
+                    "type": "string",
+                    "description": "The order ID to refund"
                 },
-                "required": ["order_id", "reason"]
-            }
+                "reason": {
+                    "type": "string",
+                    "description": "Reason for the refund"
+                }
+            },
+            "required": ["order_id", "reason"]
         }
     }
 ]
+
+# Each provider list gets its own deep copy of the specs, so editing one
+# provider's schema never changes the other's.
+
+# Tool definitions for OpenAI-compatible API (z.ai)
+tools = [{"type": "function", "function": copy.deepcopy(spec)} for spec in _TOOLS]
+
+# Tool definitions for the Anthropic Messages API
+ANTHROPIC_TOOLS = [
+    {"name": spec["name"], "description": spec["description"], "input_schema": copy.deepcopy(spec["parameters"])}
+    for spec in _TOOLS
+]
+
+# Serialized once at import for callers that send the definitions as raw JSON
+TOOLS_JSON: bytes = json.dumps(tools).encode()
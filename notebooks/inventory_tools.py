@@ -1,6 +1,9 @@
-import sqlite3
+import json
 from datetime import datetime
-from typing import Any, Dict, List
+from itertools import count
+from typing import Any, Dict, List, Tuple
+
+from db_helper import cached_table, get_conn, json_variant, transaction
 
 
 # =============================================================================
@@ -89,119 +92,130 @@ INVENTORY_TOOLS = [
     }
 ]
 
+# Serialized once at import for callers that send the definitions as raw JSON
+INVENTORY_TOOLS_JSON: bytes = json.dumps(INVENTORY_TOOLS).encode()
+
+
+# =============================================================================
+# SQL STATEMENTS
+# =============================================================================
+
+_SQL_ALL_PRODUCTS = 'SELECT product_id, name, stock, reorder_point, supplier, category, price FROM products'
+
+# search_inventory picks one of four fixed statements, keyed by
+# (category given, low_stock_only), so each stays hot in the statement cache.
+_SQL_SEARCH_INVENTORY = {
+    (False, False): 'SELECT product_id, name, category, price, stock, reorder_point FROM products',
+    (True, False): 'SELECT product_id, name, category, price, stock, reorder_point FROM products WHERE category = ?',
+    (False, True): 'SELECT product_id, name, category, price, stock, reorder_point FROM products WHERE stock <= reorder_point',
+    (True, True): 'SELECT product_id, name, category, price, stock, reorder_point FROM products WHERE category = ? AND stock <= reorder_point',
+}
+
+# Product info and its sales history in one round-trip; {placeholders} is
+# filled with one "?" per requested product.
+_SQL_SALES_TRENDS = '''
+SELECT p.product_id, p.name, p.stock, p.reorder_point, s.quantity_sold
+FROM products p
+LEFT JOIN sales_history s ON s.product_id = p.product_id
+WHERE p.product_id IN ({placeholders})
+ORDER BY p.product_id, s.date ASC
+'''
+
+_SQL_INSERT_PURCHASE_ORDER = '''
+INSERT INTO purchase_orders (po_id, product_id, quantity, unit_cost, total_cost, reason, status)
+VALUES (?, ?, ?, ?, ?, ?, 'pending')
+'''
+
+# Appended to the PO timestamp so orders created from one timestamp snapshot
+# (or within the same clock tick) still get distinct IDs.
+_po_sequence = count(1)
+
 
 # =============================================================================
 # INVENTORY TOOL FUNCTIONS
 # =============================================================================
 
+def _stock_status(stock: int, reorder_point: int) -> str:
+    """Classify a stock level against its reorder point"""
+    if stock == 0:
+        return "out_of_stock"
+    if stock <= reorder_point:
+        return "low"
+    return "healthy"
+
+
 def check_stock(product_id: str, db_name='inventory.db') -> Dict[str, Any]:
     """Check current stock level for a product"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+    product = cached_table(db_name, _SQL_ALL_PRODUCTS).get(product_id)
     
-    cursor.execute('''
-    SELECT product_id, name, stock, reorder_point, supplier, category, price
-    FROM products
-    WHERE product_id = ?
-    ''', (product_id,))
-    
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    if not product:
         return {"status": "error", "message": f"Product {product_id} not found"}
     
-    product_id, name, stock, reorder_point, supplier, category, price = row
-    
     # Determine stock status
-    stock_status = "healthy"
-    if stock <= reorder_point:
-        stock_status = "low"
-    if stock == 0:
-        stock_status = "out_of_stock"
+    stock_status = _stock_status(product["stock"], product["reorder_point"])
     
     return {
         "status": "success",
-        "product_id": product_id,
-        "product_name": name,
-        "category": category,
-        "price": price,
-        "current_stock": stock,
-        "reorder_point": reorder_point,
+        "product_id": product["product_id"],
+        "product_name": product["name"],
+        "category": product["category"],
+        "price": product["price"],
+        "current_stock": product["stock"],
+        "reorder_point": product["reorder_point"],
         "stock_status": stock_status,
-        "supplier": supplier
+        "supplier": product["supplier"]
     }
 
 
 def search_inventory(category: str = None, low_stock_only: bool = False, db_name='inventory.db') -> List[Dict[str, Any]]:
     """Search inventory by category or show low stock items"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    query = 'SELECT product_id, name, category, price, stock, reorder_point FROM products WHERE 1=1'
-    params = []
+    conn = get_conn(db_name)
     
-    if category:
-        query += ' AND category = ?'
-        params.append(category)
-    
-    if low_stock_only:
-        query += ' AND stock <= reorder_point'
-    
-    cursor.execute(query, params)
-    
-    results = []
-    for row in cursor.fetchall():
-        product_id, name, category, price, stock, reorder_point = row
-        
-        stock_status = "healthy"
-        if stock <= reorder_point:
-            stock_status = "low"
-        if stock == 0:
-            stock_status = "out_of_stock"
-        
-        results.append({
-            "product_id": product_id,
-            "name": name,
-            "category": category,
-            "price": price,
-            "stock": stock,
-            "reorder_point": reorder_point,
-            "stock_status": stock_status
-        })
+    query = _SQL_SEARCH_INVENTORY[(bool(category), bool(low_stock_only))]
+    params = (category,) if category else ()
     
-    conn.close()
-    return results
+    # sqlite3.Row rows unpack straight into plain dicts for json.dumps
+    return [
+        {**row, "stock_status": _stock_status(row["stock"], row["reorder_point"])}
+        for row in conn.execute(query, params).fetchall()
+    ]
 
 
 def get_sales_trend(product_id: str, db_name='inventory.db') -> Dict[str, Any]:
     """Get sales trend analysis for a product"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    # Get product info
-    cursor.execute('SELECT name, stock, reorder_point FROM products WHERE product_id = ?', (product_id,))
-    product = cursor.fetchone()
-    
-    if not product:
-        conn.close()
-        return {"status": "error", "message": f"Product {product_id} not found"}
-    
-    product_name, current_stock, reorder_point = product
-    
-    # Get sales history (last 7 days, ordered oldest to newest)
-    cursor.execute('''
-    SELECT date, quantity_sold 
-    FROM sales_history 
-    WHERE product_id = ? 
-    ORDER BY date ASC
-    LIMIT 7
-    ''', (product_id,))
-    
-    sales_records = cursor.fetchall()
-    conn.close()
-    
-    if not sales_records:
+    return get_sales_trends([product_id], db_name)[product_id]
+
+
+def get_sales_trends(product_ids: List[str], db_name='inventory.db') -> Dict[str, Dict[str, Any]]:
+    """Get sales trend analysis for several products with a single query"""
+    if not product_ids:
+        return {}
+    
+    conn = get_conn(db_name)
+    
+    placeholders = ', '.join('?' * len(product_ids))
+    rows = conn.execute(_SQL_SALES_TRENDS.format(placeholders=placeholders), list(product_ids)).fetchall()
+    
+    # Group the joined rows per product, keeping the first 7 days (oldest to newest)
+    products = {}
+    for product_id, name, stock, reorder_point, quantity_sold in rows:
+        product = products.setdefault(product_id, (name, stock, reorder_point, []))
+        if quantity_sold is not None and len(product[3]) < 7:
+            product[3].append(quantity_sold)
+    
+    trends = {}
+    for product_id in product_ids:
+        if product_id in products:
+            trends[product_id] = _sales_trend(product_id, *products[product_id])
+        else:
+            trends[product_id] = {"status": "error", "message": f"Product {product_id} not found"}
+    return trends
+
+
+def _sales_trend(product_id: str, product_name: str, current_stock: int, reorder_point: int,
+                 sales_quantities: List[int]) -> Dict[str, Any]:
+    """Build the sales trend result for one product from its daily quantities"""
+    if not sales_quantities:
         return {
             "status": "success",
             "product_id": product_id,
@@ -215,9 +229,6 @@ def get_sales_trend(product_id: str, db_name='inventory.db') -> Dict[str, Any]:
             "recommendation": "No sales data available"
         }
     
-    # Extract just the quantities for calculations
-    sales_quantities = [record[1] for record in sales_records]
-    
     # Calculate average daily sales
     avg_daily = sum(sales_quantities) / len(sales_quantities)
     
@@ -267,45 +278,59 @@ def get_sales_trend(product_id: str, db_name='inventory.db') -> Dict[str, Any]:
 
 def create_purchase_order(product_id: str, quantity: int, reason: str, db_name='inventory.db') -> Dict[str, Any]:
     """Create a purchase order to restock a product"""
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    # Get product details
-    cursor.execute('SELECT name, price, supplier FROM products WHERE product_id = ?', (product_id,))
-    product = cursor.fetchone()
-    
-    if not product:
-        conn.close()
-        return {"status": "error", "message": f"Product {product_id} not found"}
-    
-    product_name, retail_price, supplier = product
-    
-    # Calculate costs (assume 60% of retail price is our cost)
-    unit_cost = retail_price * 0.6
-    total_cost = unit_cost * quantity
-    
-    # Generate PO ID
-    po_id = f"PO{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    return create_purchase_orders([(product_id, quantity, reason)], db_name)[0]
+
+
+def create_purchase_orders(items: List[Tuple[str, int, str]], db_name='inventory.db') -> List[Dict[str, Any]]:
+    """Create purchase orders for (product_id, quantity, reason) items in one transaction"""
+    products = cached_table(db_name, _SQL_ALL_PRODUCTS)
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
     
-    # Insert purchase order
-    cursor.execute('''
-    INSERT INTO purchase_orders (po_id, product_id, quantity, unit_cost, total_cost, reason, status)
-    VALUES (?, ?, ?, ?, ?, ?, 'pending')
-    ''', (po_id, product_id, quantity, unit_cost, total_cost, reason))
+    rows = []
+    results = []
+    for product_id, quantity, reason in items:
+        # Get product details
+        product = products.get(product_id)
+        
+        if not product:
+            results.append({"status": "error", "message": f"Product {product_id} not found"})
+            continue
+        
+        # Calculate costs (assume 60% of retail price is our cost)
+        unit_cost = product["price"] * 0.6
+        total_cost = unit_cost * quantity
+        
+        # Generate PO ID
+        po_id = f"PO{stamp}{next(_po_sequence):04d}"
+        
+        rows.append((po_id, product_id, quantity, unit_cost, total_cost, reason))
+        results.append({
+            "status": "success",
+            "purchase_order_id": po_id,
+            "product_id": product_id,
+            "product_name": product["name"],
+            "quantity": quantity,
+            "unit_cost": round(unit_cost, 2),
+            "total_cost": round(total_cost, 2),
+            "supplier": product["supplier"],
+            "reason": reason,
+            "estimated_delivery": "5-7 business days",
+            "message": f"Purchase order {po_id} created successfully"
+        })
     
-    conn.commit()
-    conn.close()
+    # Insert all purchase orders at once
+    if rows:
+        conn = get_conn(db_name)
+        with transaction(conn):
+            conn.executemany(_SQL_INSERT_PURCHASE_ORDER, rows)
     
-    return {
-        "status": "success",
-        "purchase_order_id": po_id,
-        "product_id": product_id,
-        "product_name": product_name,
-        "quantity": quantity,
-        "unit_cost": round(unit_cost, 2),
-        "total_cost": round(total_cost, 2),
-        "supplier": supplier,
-        "reason": reason,
-        "estimated_delivery": "5-7 business days",
-        "message": f"Purchase order {po_id} created successfully"
-    }
\ No newline at end of file
+    return results
+
+
+# JSON-encoded variants of the inventory tools, ready to send to the LLM
+check_stock_json = json_variant(check_stock)
+search_inventory_json = json_variant(search_inventory)
+get_sales_trend_json = json_variant(get_sales_trend)
+get_sales_trends_json = json_variant(get_sales_trends)
+create_purchase_order_json = json_variant(create_purchase_order)
+create_purchase_orders_json = json_variant(create_purchase_orders)